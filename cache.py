@@ -0,0 +1,105 @@
+import copy
+import functools
+import hashlib
+import inspect
+import json
+import os
+import tempfile
+import threading
+import time
+
+# ============================================================================
+# FILE-BACKED TTL CACHE
+# ============================================================================
+
+# Streamlit re-executes the app script on every rerun but keeps imported modules,
+# so the in-process layer lives here to survive reruns: {path: (ts, data)}
+_memory = {}
+_memory_lock = threading.Lock()
+
+class FileCache:
+    """Stores JSON results on disk as {root}/{namespace}/{md5(key)}.json, memoized in-process"""
+    
+    def __init__(self, root):
+        self.root = root
+    
+    def _path(self, namespace, key):
+        digest = hashlib.md5(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()
+        return os.path.join(self.root, namespace, f"{digest}.json")
+    
+    def get(self, namespace, key, ttl):
+        """Return cached data if younger than ttl seconds, else None"""
+        path = self._path(namespace, key)
+        with _memory_lock:
+            entry = _memory.get(path)
+        
+        if entry is None:
+            try:
+                with open(path, encoding='utf-8') as f:
+                    envelope = json.load(f)
+                entry = (float(envelope['ts']), envelope['data'])
+            except (OSError, ValueError, KeyError, TypeError):
+                # Unreadable, corrupt or foreign files are just misses
+                return None
+            with _memory_lock:
+                _memory[path] = entry
+        
+        ts, data = entry
+        if time.time() - ts >= ttl:
+            return None
+        # Callers may mutate the result, so never hand out the memoized object
+        return copy.deepcopy(data)
+    
+    def set(self, namespace, key, data):
+        """Write data atomically; the cache is best-effort, so failures are ignored"""
+        path = self._path(namespace, key)
+        ts = time.time()
+        with _memory_lock:
+            _memory[path] = (ts, copy.deepcopy(data))
+        
+        tmp_path = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'ts': ts, 'data': data}, f)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError):
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    
+    def cached(self, namespace, ttl, should_cache=None, key_params=()):
+        """Decorate fetch(ticker, ...) so hits skip the network; only results passing should_cache are stored
+
+        Entries are keyed by ticker plus the arguments named in key_params; other
+        arguments are passed through to fetch without affecting the key. The
+        wrapper's is_cached(ticker, ...) reports a hit without calling fetch.
+        """
+        def decorator(fetch):
+            signature = inspect.signature(fetch)
+            
+            def cache_key(ticker, *args, **kwargs):
+                bound = signature.bind(ticker, *args, **kwargs)
+                bound.apply_defaults()
+                key = {'ticker': ticker}
+                key.update({name: bound.arguments[name] for name in key_params})
+                return key
+            
+            @functools.wraps(fetch)
+            def wrapper(ticker, *args, **kwargs):
+                key = cache_key(ticker, *args, **kwargs)
+                data = self.get(namespace, key, ttl)
+                if data is not None:
+                    return data
+                
+                data = fetch(ticker, *args, **kwargs)
+                if should_cache is None or should_cache(data):
+                    self.set(namespace, key, data)
+                return data
+            
+            def is_cached(ticker, *args, **kwargs):
+                return self.get(namespace, cache_key(ticker, *args, **kwargs), ttl) is not None
+            
+            wrapper.is_cached = is_cached
+            return wrapper
+        return decorator
@@ -3,8 +3,19 @@ import pandas as pd
 import numpy as np
 import yfinance as yf
 import requests
+import orjson
+import inspect
+import io
+import os
+import re
+import threading
+import time
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 import warnings
+from cache import FileCache
 warnings.filterwarnings('ignore')
 
 st.set_page_config(page_title="Stock Screener - Raw Data", layout="wide")
@@ -23,26 +34,163 @@ DEFINITIONS = {
     'MA_200': 'Daily closing prices'
 }
 
+# Output columns, in display order, with nullable dtypes so missing values
+# don't push numeric columns to object dtype
+RAW_DATA_SCHEMA = {
+    'ticker': 'string',
+    'yahoo_status': 'string',
+    'sec_status': 'string',
+    'sec_filing_date': 'string',
+    'current_price': 'Float64',
+    'market_cap': 'Int64',
+    'shares_outstanding': 'Int64',
+    'trailing_pe': 'Float64',
+    'eps_ttm': 'Float64',
+    'dividend_yield': 'Float64',
+    'book_value': 'Float64',
+    'pb_ratio': 'Float64',
+    'gross_margin': 'Float64',
+    'net_margin': 'Float64',
+    'roa': 'Float64',
+    'roe': 'Float64',
+    'revenue_ttm': 'Int64',
+    'net_income_ttm': 'Int64',
+    'total_debt': 'Int64',
+    'debt_to_equity': 'Float64',
+    'price_52w_high': 'Float64',
+    'price_52w_low': 'Float64',
+    'avg_volume': 'Int64',
+    'daily_closes_available': 'boolean',
+}
+
+# Tickers may be separated by newlines, commas or spaces
+TICKER_SEPARATORS = re.compile(r'[\s,]+')
+
+# Fetches are network-bound, so a small thread pool overlaps them
+MAX_FETCH_WORKERS = 16
+
+# SEC asks automated clients to identify themselves with a contact address
+SEC_USER_AGENT = 'Stock Screener admin@example.com'
+
+@st.cache_resource(show_spinner=False)
+def create_pooled_session(headers):
+    """Build a keep-alive session that retries throttled/failed requests
+    
+    Cached as a resource so connections (and Yahoo's cookie/crumb) survive reruns.
+    """
+    session = requests.Session()
+    session.headers.update(headers)
+    adapter = HTTPAdapter(
+        pool_connections=10,
+        pool_maxsize=50,
+        max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504]),
+    )
+    session.mount('https://', adapter)
+    return session
+
+# Shared by every SEC request so TCP/TLS connections are reused across tickers
+SEC_SESSION = create_pooled_session({'User-Agent': SEC_USER_AGENT})
+
+class RateLimiter:
+    """Thread-safe limiter that spaces calls to at most `rate` per second"""
+    
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._next_slot = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def wait(self):
+        """Block until the caller's slot comes up"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + self.interval
+        time.sleep(slot - now)
+
+@st.cache_resource(show_spinner=False)
+def create_rate_limiter(rate):
+    """One limiter per process, since the limit applies per IP across reruns and sessions"""
+    return RateLimiter(rate)
+
+# SEC EDGAR allows 10 requests/second per IP; bursts past it get 429s and backoff
+SEC_RATE_LIMITER = create_rate_limiter(10)
+# Enough SEC workers to keep the limiter busy; more would only sleep in it
+SEC_MAX_WORKERS = 10
+
+# Shared by every yfinance call for its connection pool and retries. No custom
+# headers: yfinance sends its own User-Agent on every request (including the
+# cookie/crumb ones), overriding the session's
+YF_SESSION = create_pooled_session({})
+
+@st.cache_resource(show_spinner=False)
+def create_process_lock(name):
+    """One lock per name, shared by every rerun and browser session in the process"""
+    return threading.Lock()
+
+# yf.download() (0.2.32) collects results in module-global yfinance.shared._DFS,
+# which every call resets and then polls until it holds all of its tickers.
+# Overlapping downloads from two sessions would drop/mix tickers or hang.
+YF_DOWNLOAD_LOCK = create_process_lock('yf.download')
+
+# On-disk cache so re-runs within the TTL skip the network entirely
+FILE_CACHE = FileCache(os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache'))
+YAHOO_CACHE_TTL = 3600        # quotes go stale quickly
+SEC_CACHE_TTL = 86400         # 10-K filing metadata changes at most daily
+
 # ============================================================================
 # SEC FILING DATA RETRIEVAL (ON-DEMAND ONLY)
 # ============================================================================
 
-def get_sec_filing_info(ticker):
-    """Fetch ONLY SEC 10-K metadata (fast, minimal parsing)"""
+@st.cache_resource(ttl=SEC_CACHE_TTL, show_spinner=False)
+def get_cik_map():
+    """Ticker -> 10-digit CIK for every SEC registrant, from one bulk download per day"""
+    cik_map = FILE_CACHE.get('sec_cik_map', 'company_tickers', SEC_CACHE_TTL)
+    if cik_map is None:
+        SEC_RATE_LIMITER.wait()
+        response = SEC_SESSION.get("https://www.sec.gov/files/company_tickers.json", timeout=10)
+        response.raise_for_status()
+        cik_map = {entry['ticker']: str(entry['cik_str']).zfill(10) for entry in orjson.loads(response.content).values()}
+        FILE_CACHE.set('sec_cik_map', 'company_tickers', cik_map)
+    return cik_map
+
+@FILE_CACHE.cached('sec_filing_info', SEC_CACHE_TTL,
+                   should_cache=lambda d: d['sec_status'] in ('✅ Found', '❌ Not found'))
+def get_sec_filing_info(ticker, cik_map):
+    """Fetch ONLY SEC 10-K metadata (fast, minimal parsing)
+    
+    cik_map is get_cik_map()'s result, loaded once by the caller; None means
+    it could not be loaded and the ticker is reported unavailable.
+    """
     sec_data = {
         'sec_filing_date': None,
         'sec_status': None,
     }
     
+    if cik_map is None:
+        sec_data['sec_status'] = '⚠️ SEC unavailable'
+        return sec_data
+    
     try:
-        url = f"https://www.sec.gov/cgi-bin/browse-edgar?action=getcompany&CIK={ticker}&type=10-K&dateb=&owner=exclude&count=1&output=json"
-        response = requests.get(url, timeout=5)
+        # SEC lists share classes with '-' (BRK-B) where users often type '.'
+        cik = cik_map.get(ticker.replace('.', '-'))
+        if cik is None:
+            sec_data['sec_status'] = '❌ Not found'
+            return sec_data
+        
+        url = f"https://data.sec.gov/submissions/CIK{cik}.json"
+        SEC_RATE_LIMITER.wait()
+        response = SEC_SESSION.get(url, timeout=5)
         
         if response.status_code == 200:
-            data = response.json()
-            if 'filings' in data and data['filings'].get('filings'):
-                filing = data['filings']['filings'][0]
-                sec_data['sec_filing_date'] = filing.get('filingDate', None)
+            data = orjson.loads(response.content)
+            recent = data.get('filings', {}).get('recent', {})
+            # Recent filings are listed newest first
+            filing_date = next(
+                (date for form, date in zip(recent.get('form', []), recent.get('filingDate', [])) if form == '10-K'),
+                None
+            )
+            if filing_date:
+                sec_data['sec_filing_date'] = filing_date
                 sec_data['sec_status'] = '✅ Found'
             else:
                 sec_data['sec_status'] = '❌ Not found'
@@ -57,8 +205,72 @@ def get_sec_filing_info(ticker):
 # YAHOO FINANCE DATA RETRIEVAL (FAST)
 # ============================================================================
 
-def get_yahoo_finance_data(ticker):
-    """Fetch raw Yahoo Finance data - OPTIMIZED FOR SPEED"""
+# quoteSummary modules that hold every stock.info field the table reads
+QUOTE_SUMMARY_MODULES = ['summaryDetail', 'defaultKeyStatistics', 'financialData']
+
+def get_quote_summary_fields(stock):
+    """stock.info's keys from just QUOTE_SUMMARY_MODULES, skipping yfinance's extra info requests"""
+    url = f"https://query2.finance.yahoo.com/v10/finance/quoteSummary/{stock.ticker}"
+    params = {'modules': ','.join(QUOTE_SUMMARY_MODULES)}
+    
+    # stock._data (private yfinance API, checked against the pinned 0.2.32) attaches
+    # Yahoo's cookie/crumb; quoteSummary rejects requests without them. Check it
+    # exists up front so errors from the request itself still surface normally.
+    data_get = getattr(getattr(stock, '_data', None), 'get', None)
+    try:
+        inspect.signature(data_get).bind(url, params=params, timeout=10)
+    except (TypeError, ValueError):
+        # yfinance internals changed: degrade to the slower public API
+        return stock.info
+    
+    response = data_get(url, params=params, timeout=10)
+    response.raise_for_status()
+    result = orjson.loads(response.content)['quoteSummary']['result'][0]
+    
+    # Merge the modules and unwrap {'raw': ..., 'fmt': ...} values. Like stock.info,
+    # skip empty entries ({} means "no value") so one module's blank can't
+    # overwrite another module's value for the same key.
+    fields = {}
+    for module in result.values():
+        if not isinstance(module, dict):
+            continue
+        for key, value in module.items():
+            if isinstance(value, dict):
+                value = value.get('raw')
+            if value is not None:
+                fields[key] = value
+    return fields
+
+def get_fast_info_fields(stock, hist):
+    """Price, size, range and volume fields in stock.info's keys, without the full info request"""
+    if not len(hist):
+        # Mistyped/delisted tickers come back from the batched download as empty frames
+        raise ValueError('no price history')
+    
+    shares = stock.fast_info['shares']
+    current_price = float(hist['Close'].iat[-1])
+    
+    return {
+        'currentPrice': current_price,
+        'marketCap': int(shares * current_price) if shares else None,
+        'sharesOutstanding': shares,
+        # Unadjusted High/Low (see get_yahoo_price_history), like stock.info's 52W range
+        'fiftyTwoWeekHigh': float(hist['High'].max()),
+        'fiftyTwoWeekLow': float(hist['Low'].min()),
+        # stock.info's averageVolume covers ~3 months of sessions
+        'averageVolume': int(hist['Volume'].tail(63).mean()),
+    }
+
+@FILE_CACHE.cached('yahoo_finance', YAHOO_CACHE_TTL,
+                   should_cache=lambda d: d['yahoo_status'] == '✅ Success',
+                   key_params=('full_info',))
+def get_yahoo_finance_data(ticker, hist=None, full_info=True):
+    """Fetch raw Yahoo Finance data - OPTIMIZED FOR SPEED
+    
+    Pass the ticker's slice of get_yahoo_price_history() as hist to skip the
+    per-ticker history request. With full_info=False only the fast fields
+    (price, market cap, shares, 52W range, volume) are fetched.
+    """
     raw_data = {
         'ticker': ticker,
         'yahoo_status': None,
@@ -85,12 +297,13 @@ def get_yahoo_finance_data(ticker):
     }
     
     try:
-        stock = yf.Ticker(ticker)
-        info = stock.info
-        hist = stock.history(period="1y")
+        stock = yf.Ticker(ticker, session=YF_SESSION)
+        if hist is None:
+            hist = stock.history(period="1y", auto_adjust=False)
+        info = get_quote_summary_fields(stock) if full_info else get_fast_info_fields(stock, hist)
         
         # Price Data
-        raw_data['current_price'] = info.get('currentPrice') or (hist['Close'].iloc[-1] if not hist.empty else None)
+        raw_data['current_price'] = info.get('currentPrice') or (float(hist['Close'].iat[-1]) if len(hist) else None)
         raw_data['market_cap'] = info.get('marketCap')
         raw_data['shares_outstanding'] = info.get('sharesOutstanding')
         
@@ -119,7 +332,7 @@ def get_yahoo_finance_data(ticker):
         raw_data['price_52w_high'] = info.get('fiftyTwoWeekHigh')
         raw_data['price_52w_low'] = info.get('fiftyTwoWeekLow')
         raw_data['avg_volume'] = info.get('averageVolume')
-        raw_data['daily_closes_available'] = not hist.empty
+        raw_data['daily_closes_available'] = len(hist) > 0
         
         raw_data['yahoo_status'] = '✅ Success'
         
@@ -129,6 +342,59 @@ def get_yahoo_finance_data(ticker):
         raw_data['yahoo_status'] = f"❌ Error: {str(e)[:30]}"
         return raw_data
 
+# Daily history columns used for price fallback, 52W range and volume
+PRICE_HISTORY_COLUMNS = ['Close', 'High', 'Low', 'Volume']
+PRICE_HISTORY_DTYPES = {'Close': np.float32, 'High': np.float32, 'Low': np.float32, 'Volume': np.float64}
+
+def get_yahoo_price_history(tickers):
+    """Fetch 1y daily history for all tickers in one batched download -> {ticker: DataFrame}
+    
+    Prices are unadjusted (auto_adjust=False) so High/Low match the traded
+    52W range that stock.info reports; dividend-adjusted values would not.
+    """
+    try:
+        with YF_DOWNLOAD_LOCK:
+            hist_all = yf.download(" ".join(tickers), period="1y", group_by='ticker',
+                                   auto_adjust=False, threads=True, progress=False, session=YF_SESSION)
+    except Exception:
+        # Fall back to per-ticker history requests
+        return {}
+    
+    # Keep only the columns get_yahoo_finance_data() reads: the per-ticker frames
+    # stay alive until every worker has finished. Prices fit float32 (Yahoo quotes
+    # are single precision); Volume stays float64, as float32 can't hold counts
+    # above 2**24 exactly.
+    def trim(hist):
+        return hist[PRICE_HISTORY_COLUMNS].dropna(how='all').astype(PRICE_HISTORY_DTYPES)
+    
+    # A single ticker comes back as a flat frame rather than one keyed by ticker
+    if not isinstance(hist_all.columns, pd.MultiIndex):
+        return {tickers[0]: trim(hist_all)}
+    
+    available = set(hist_all.columns.get_level_values(0))
+    # Batched frames share one date index, so drop rows padded for other tickers
+    return {ticker: trim(hist_all[ticker]) for ticker in tickers if ticker in available}
+
+# ============================================================================
+# RAW DATA TABLE
+# ============================================================================
+
+def build_raw_dataframe(rows):
+    """Build the results table column by column with RAW_DATA_SCHEMA's dtypes (no inference)"""
+    columns = {}
+    for column, dtype in RAW_DATA_SCHEMA.items():
+        values = [row.get(column) for row in rows]
+        if dtype in ('Int64', 'Float64'):
+            # Yahoo occasionally reports 'Infinity' (e.g. trailingPE); treat it as missing
+            numeric = pd.to_numeric(pd.Series(values, dtype=object), errors='coerce')
+            numeric = numeric.where(np.isfinite(numeric))
+            if dtype == 'Int64':
+                numeric = numeric.round()
+            columns[column] = numeric.astype(dtype)
+        else:
+            columns[column] = pd.array(values, dtype=dtype)
+    return pd.DataFrame(columns)
+
 # ============================================================================
 # MAIN APP
 # ============================================================================
@@ -138,6 +404,13 @@ st.sidebar.markdown("**Metric Definitions:**")
 for key, value in DEFINITIONS.items():
     st.sidebar.text(f"{key}: {value}")
 
+st.sidebar.markdown("**Fetch Mode:**")
+full_info = st.sidebar.checkbox(
+    "Full fundamentals (slower)",
+    value=True,
+    help="Off = fast mode: price, market cap, shares, 52W range and volume only"
+)
+
 st.divider()
 
 # Input: Stock list
@@ -149,16 +422,8 @@ stock_list = st.text_area(
     help="One ticker per line, or comma-separated"
 )
 
-# Parse tickers
-if stock_list:
-    tickers = []
-    lines = stock_list.strip().split('\n')
-    for line in lines:
-        line_tickers = [t.strip().upper() for t in line.split(',')]
-        tickers.extend([t for t in line_tickers if t])
-    tickers = list(set(tickers))
-else:
-    tickers = []
+# Parse tickers: split on any run of commas/whitespace, dedupe keeping input order
+tickers = list(dict.fromkeys(t for t in TICKER_SEPARATORS.split(stock_list.upper()) if t))
 
 st.info(f"📌 Found {len(tickers)} ticker(s): {', '.join(tickers)}")
 
@@ -174,21 +439,48 @@ if st.button("⚡ Fetch Data Now (Yahoo + SEC)", use_container_width=True):
         progress_bar = st.progress(0)
         status_text = st.empty()
         
-        all_raw_data = []
+        results = {ticker: {} for ticker in tickers}
         
-        for idx, ticker in enumerate(tickers):
-            status_text.text(f"Fetching {ticker}... ({idx+1}/{len(tickers)})")
-            progress = (idx + 1) / len(tickers)
-            progress_bar.progress(progress)
-            
-            # Always fetch Yahoo data (fast)
-            yahoo_data = get_yahoo_finance_data(ticker)
+        # Yahoo and SEC lookups are independent, so submit them as separate jobs:
+        # SEC requests run while the batched price history downloads, and one
+        # ticker's SEC request never waits behind its Yahoo request. SEC jobs get
+        # their own pool because they sleep on the rate limiter and would
+        # otherwise hold every worker. UI updates stay on the script thread.
+        with ThreadPoolExecutor(max_workers=min(SEC_MAX_WORKERS, len(tickers))) as sec_executor, \
+             ThreadPoolExecutor(max_workers=min(MAX_FETCH_WORKERS, len(tickers))) as yahoo_executor:
+            # Load the CIK map once, here: a failed download isn't memoized, so
+            # leaving it to the SEC jobs would retry it (slowly) once per ticker
+            cik_map = None
+            if not all(get_sec_filing_info.is_cached(ticker, None) for ticker in tickers):
+                status_text.text("Loading SEC ticker → CIK map...")
+                try:
+                    cik_map = get_cik_map()
+                except Exception:
+                    pass
+            futures = {sec_executor.submit(get_sec_filing_info, ticker, cik_map): ticker for ticker in tickers}
             
-            # Always fetch SEC data (only when button clicked)
-            sec_data = get_sec_filing_info(ticker)
-            yahoo_data.update(sec_data)
+            # Only tickers that miss the Yahoo cache need price history
+            uncached = [ticker for ticker in tickers
+                        if not get_yahoo_finance_data.is_cached(ticker, full_info=full_info)]
+            histories = {}
+            if uncached:
+                status_text.text(f"Downloading price history for {len(uncached)} ticker(s)...")
+                histories = get_yahoo_price_history(uncached)
+            for ticker in tickers:
+                futures[yahoo_executor.submit(get_yahoo_finance_data, ticker, histories.get(ticker), full_info=full_info)] = ticker
             
-            all_raw_data.append(yahoo_data)
+            # Each UI update is a websocket message, so refresh ~50 times at most
+            update_every = max(1, len(futures) // 50)
+            for completed, future in enumerate(as_completed(futures), start=1):
+                ticker = futures[future]
+                results[ticker].update(future.result())
+                
+                if completed % update_every == 0 or completed == len(futures):
+                    status_text.text(f"Fetched {ticker}... ({completed}/{len(futures)} requests)")
+                    progress_bar.progress(completed / len(futures))
+        
+        # Keep the table in input order regardless of completion order
+        all_raw_data = [results[ticker] for ticker in tickers]
         
         progress_bar.empty()
         status_text.empty()
@@ -198,37 +490,7 @@ if st.button("⚡ Fetch Data Now (Yahoo + SEC)", use_container_width=True):
         st.subheader("3️⃣ Raw Data Collection Results")
         
         if all_raw_data:
-            df_raw = pd.DataFrame(all_raw_data)
-            
-            # Reorder columns for clarity
-            column_order = [
-                'ticker',
-                'yahoo_status',
-                'sec_status',
-                'sec_filing_date',
-                'current_price',
-                'market_cap',
-                'shares_outstanding',
-                'trailing_pe',
-                'eps_ttm',
-                'dividend_yield',
-                'book_value',
-                'pb_ratio',
-                'gross_margin',
-                'net_margin',
-                'roa',
-                'roe',
-                'revenue_ttm',
-                'net_income_ttm',
-                'total_debt',
-                'debt_to_equity',
-                'price_52w_high',
-                'price_52w_low',
-                'avg_volume',
-                'daily_closes_available',
-            ]
-            
-            df_raw = df_raw[column_order]
+            df_raw = build_raw_dataframe(all_raw_data)
             
             # Display full table
             st.dataframe(df_raw, use_container_width=True, height=400)
@@ -241,21 +503,23 @@ if st.button("⚡ Fetch Data Now (Yahoo + SEC)", use_container_width=True):
                 st.metric("Total Tickers", len(tickers))
             
             with col2:
-                successful_yahoo = sum(1 for s in df_raw['yahoo_status'] if '✅' in s)
+                successful_yahoo = int(df_raw['yahoo_status'].str.startswith('✅', na=False).sum())
                 st.metric("Yahoo Success", successful_yahoo)
             
             with col3:
-                successful_sec = sum(1 for s in df_raw['sec_status'] if '✅' in s)
+                successful_sec = int(df_raw['sec_status'].str.startswith('✅', na=False).sum())
                 st.metric("SEC Found", successful_sec)
             
             # Download raw data
             st.divider()
-            csv = df_raw.to_csv(index=False)
+            # Write gzipped bytes straight into a buffer: no intermediate CSV string
+            csv_buffer = io.BytesIO()
+            df_raw.to_csv(csv_buffer, index=False, encoding='utf-8', compression='gzip')
             st.download_button(
-                label="📥 Download Raw Data (CSV)",
-                data=csv,
-                file_name=f"raw_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                mime="text/csv"
+                label="📥 Download Raw Data (CSV, gzip)",
+                data=csv_buffer.getvalue(),
+                file_name=f"raw_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv.gz",
+                mime="application/gzip"
             )
             
             st.success("✅ Data collection complete!")